@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""CRC-16/XMODEM (poly 0x1021, init 0, no reflection) for the verify scripts.
+
+This is the CRC the device puts in every data frame (body[3:5]).
+crc16_xmodem() is binascii.crc_hqx, the same CRC implemented in C;
+crc16_xmodem_py() is a plain byte-table version of it, kept as a readable
+reference and checked against crc_hqx by running this file.
+"""
+from binascii import crc_hqx
+
+
+def _byte_table(poly=0x1021):
+    # _TABLE[b] is the CRC of the single byte b
+    table = []
+    for b in range(256):
+        crc = b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly if crc & 0x8000 else crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+_TABLE = _byte_table()
+
+
+def crc16_xmodem(data, init=0x0000):
+    """CRC of any bytes-like object (bytes, bytearray, memoryview, mmap)."""
+    return crc_hqx(data, init)
+
+
+def crc16_xmodem_py(data, init=0x0000):
+    """Pure-Python crc16_xmodem(): one table lookup per byte."""
+    crc = init
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def crc16_xmodem_blocks(buf, size):
+    """CRC of each size-byte block of buf (the last block may be short)."""
+    view = memoryview(buf)
+    return [crc_hqx(view[o:o + size], 0) for o in range(0, len(buf), size)]
+
+
+if __name__ == '__main__':
+    import os
+    sample = os.urandom(4099)
+    # CRC-16/XMODEM check value
+    assert crc16_xmodem(b'123456789') == crc16_xmodem_py(b'123456789') == 0x31C3
+    assert crc16_xmodem(sample) == crc16_xmodem_py(sample)
+    assert crc16_xmodem_blocks(b'123456789', 4) == [
+        crc16_xmodem(b'1234'), crc16_xmodem(b'5678'), crc16_xmodem(b'9')]
+    print('crc16_xmodem OK')
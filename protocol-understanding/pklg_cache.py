@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Shared record table for Apple PacketLogger (.pklg) captures.
+
+Each record is [len LE32][timestamp 8 bytes][type 1 byte][payload len-9 bytes].
+load_records() walks the file once and stores the table next to the capture
+(<path>.records), keyed by the capture's mtime and size plus RECORDS_VERSION,
+so the probe scripts don't re-walk the same cap.pklg on every run.
+"""
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from array import array
+from contextlib import suppress
+from itertools import compress
+
+# Record header: length LE32, timestamp LE64, packet type
+_HDR = struct.Struct('<IQB')
+
+# Bump whenever walk_records() changes what it returns, so old .records
+# sidecars are rebuilt instead of silently reused
+RECORDS_VERSION = 1
+
+
+def open_pklg(path):
+    """Map the capture read-only; slices are bytes, struct.unpack_from works on it."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''  # mmap can't map an empty file; it simply has no records
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def walk_records(raw):
+    """Return (offsets, lengths, types, timestamps) columns for every record.
+
+    offsets[i] is the start of record i, lengths[i] its payload length (clamped
+    to the end of the file), timestamps[i] the 8 timestamp bytes as LE uint64.
+    """
+    offsets = array('q')
+    lengths = array('q')
+    types = bytearray()
+    timestamps = array('Q')
+    # The walk is inherently serial (each offset depends on the previous
+    # length), so keep the loop body to one header unpack and four appends
+    add_offset, add_length = offsets.append, lengths.append
+    add_type, add_timestamp = types.append, timestamps.append
+    unpack_hdr = _HDR.unpack_from
+    size = len(raw)
+    off = 0
+    while off + 13 <= size:
+        rec_len, ts, ptype = unpack_hdr(raw, off)
+        add_offset(off)
+        add_length(min(rec_len - 9, size - off - 13))
+        add_timestamp(ts)
+        add_type(ptype)
+        off += 4 + rec_len
+    return offsets, lengths, types, timestamps
+
+
+def type_mask(types, *wanted):
+    """Return bytes with 1 where types[i] is one of wanted, else 0.
+
+    Built with a single translate() over the whole types column, so per-type
+    counts and filters need no Python-level loop over the records.
+    """
+    return types.translate(bytes(t in wanted for t in range(256)))
+
+
+def acl_indices(types):
+    """Indices of the ACL (TX/RX) records in a types column, in capture order.
+
+    The filter runs in C (translate + compress), so callers can loop over the
+    ACL records only instead of skipping HCI commands/events one by one.
+    """
+    return list(compress(range(len(types)), type_mask(types, 2, 3)))
+
+
+def cached(path, suffix, build, version):
+    """Return build(), pickled next to the capture at path as <path><suffix>.
+
+    The pickle is keyed by the capture's mtime and size and by version, so
+    editing or replacing cap.pklg, or bumping the builder's format version
+    after changing its output, rebuilds it; an unreadable or stale cache is
+    ignored. The pickle is written to a temp file and renamed into place, so
+    an interrupted or concurrent run never leaves a truncated one behind.
+    """
+    st = os.stat(path)
+    key = (version, st.st_mtime_ns, st.st_size)
+    cache_path = path + suffix
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, value = pickle.load(f)
+        if cached_key == key:
+            return value
+    except Exception:
+        pass  # missing, corrupt or from an older layout: rebuild it
+
+    value = build()
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + '.',
+                                        suffix='.tmp',
+                                        dir=os.path.dirname(cache_path) or '.')
+    except OSError:
+        return value  # read-only capture directory: just skip the cache
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # e.g. disk full: the cache is only an optimisation
+    finally:
+        with suppress(FileNotFoundError):  # already renamed on success
+            os.unlink(tmp_path)
+    return value
+
+
+def load_records(path):
+    """Return (raw, offsets, lengths, types, timestamps) for the capture at path.
+
+    Record i's payload is raw[offsets[i] + 13:offsets[i] + 13 + lengths[i]].
+    """
+    raw = open_pklg(path)
+    return (raw,) + cached(path, '.records', lambda: walk_records(raw), RECORDS_VERSION)
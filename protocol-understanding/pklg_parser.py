@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Shared L2CAP reassembly + FE DC BA frame extraction for .pklg captures.
+
+Works on the column-wise record table from pklg_cache (walk_records() or
+load_records()), so every script reassembles ACL fragments the same way.
+load_fe_frames() additionally caches the extracted frames next to the capture
+(<path>.frames), like the record table; bump FRAMES_VERSION whenever
+iter_l2cap() or iter_fe_frames() changes what they yield.
+"""
+import struct
+
+from pklg_cache import RECORDS_VERSION, acl_indices, cached, load_records
+
+_U16 = struct.Struct('<H')
+_FEHDR = struct.Struct('>BBH').unpack_from  # flag, cmd, body length
+
+FE_MAGIC = b'\xFE\xDC\xBA'
+
+# Format version of the .frames sidecar; its cache key also includes
+# RECORDS_VERSION, since the frames are built from the record table
+FRAMES_VERSION = 1
+
+
+def iter_l2cap(raw, rec_off, rec_len, rec_type):
+    """Yield (rec_idx, ptype, data) for every complete L2CAP PDU.
+
+    rec_idx/ptype are those of the first (PB=00) fragment; data is the PDU
+    payload starting at the ATT opcode, trimmed to the L2CAP length.
+    """
+    current = None
+    for i in acl_indices(rec_type):
+        n_p = rec_len[i]
+        if n_p < 4:
+            continue
+        p = raw[rec_off[i] + 13:rec_off[i] + 13 + n_p]
+        flags = p[1] >> 4  # PB flags: top nibble of the LE16 handle word
+        if flags == 0x00:  # First fragment (PB=00)
+            if n_p < 8:
+                continue
+            l2cap_len = _U16.unpack_from(p, 4)[0]
+            # Size the buffer for the whole PDU and copy fragments into place
+            buf = bytearray(l2cap_len)
+            pos = min(n_p - 8, l2cap_len)
+            buf[:pos] = memoryview(p)[8:8 + pos]
+            current = [i, rec_type[i], buf, pos]
+        elif flags == 0x01 and current:  # Continuation (PB=01)
+            buf, pos = current[2], current[3]
+            n = min(n_p - 4, len(buf) - pos)
+            buf[pos:pos + n] = memoryview(p)[4:4 + n]
+            current[3] = pos + n
+        else:
+            continue
+        if current and current[3] >= len(current[2]):
+            yield current[0], current[1], bytes(current[2])
+            current = None
+
+
+def iter_fe_frames(raw, rec_off, rec_len, rec_type, opcodes=None):
+    """Yield (rec_idx, ptype, flag, cmd, body) for each EF-terminated FE frame.
+
+    Only the first FE DC BA header in each PDU's ATT value is considered, and
+    only if it starts before len(value) - 7, matching the old per-byte scans.
+    If opcodes is given, PDUs whose ATT opcode (data[0]) is not in it are
+    skipped.
+    """
+    for rec_idx, ptype, data in iter_l2cap(raw, rec_off, rec_len, rec_type):
+        if opcodes is not None and (not data or data[0] not in opcodes):
+            continue
+        # The ATT value is data[3:]; search it in place instead of slicing it
+        # off, with the end bound keeping a match before len(data) - 7
+        n = len(data)
+        idx = data.find(FE_MAGIC, 3, max(n - 5, 0))
+        if idx < 0:
+            continue
+        flag, cmd, blen = _FEHDR(data, idx + 3)
+        end = idx + 7 + blen
+        if end < n and data[end] == 0xEF:
+            yield rec_idx, ptype, flag, cmd, data[idx + 7:end]
+
+
+def load_fe_frames(path):
+    """Return the list of iter_fe_frames() tuples for the capture at path."""
+    def build():
+        raw, rec_off, rec_len, rec_type, _ = load_records(path)
+        return list(iter_fe_frames(raw, rec_off, rec_len, rec_type))
+    return cached(path, '.frames', build, (RECORDS_VERSION, FRAMES_VERSION))
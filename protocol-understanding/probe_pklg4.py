@@ -1,24 +1,36 @@
 #!/usr/bin/env python3
 """Count FE DC BA data frames by scanning across record boundaries."""
 import struct
+from collections import Counter
+from itertools import compress
+
+from pklg_cache import load_records, type_mask
+
+_U32LE = struct.Struct('<I').unpack_from
 
 path = '/Users/herbst/git/bluetooth-tag/cap.pklg'
-raw = open(path, 'rb').read()
 
 # First, reconstruct the full BLE data stream by concatenating payloads in order
-records = []
-pos = 0
-while pos + 13 < len(raw):
-    rec_len = struct.unpack('<I', raw[pos:pos+4])[0]
-    if rec_len < 9 or rec_len > 100000 or pos + 4 + rec_len > len(raw):
+# Record table is column-wise: record i starts at rec_off[i], has type rec_type[i]
+# and a rec_len[i]-byte payload
+raw, rec_off, rec_len, rec_type, _ = load_records(path)
+# The shared table clamps a truncated last record and walks past bad lengths;
+# this script stops at the first malformed record, so only the first n_rec
+# entries count (and keep the same indices as before)
+n_rec = 0
+for off in rec_off:
+    full_len = _U32LE(raw, off)[0]
+    if off + 13 >= len(raw) or full_len < 9 or full_len > 100000 or off + 4 + full_len > len(raw):
         break
-    ts = struct.unpack('<Q', raw[pos+4:pos+12])[0]
-    pkt_type = raw[pos+12]
-    payload = raw[pos+13:pos+4+rec_len]
-    records.append({'ts': ts, 'type': pkt_type, 'payload': bytes(payload)})
-    pos += 4 + rec_len
+    n_rec += 1
+# Payloads and frame bodies are only peeked at, so hand out zero-copy views
+# into the mapped capture rather than copying each slice into a new bytes
+raw_view = memoryview(raw)
+
+def rec_payload(i):
+    return raw_view[rec_off[i] + 13:rec_off[i] + 13 + rec_len[i]]
 
-print(f"Total records: {len(records)}")
+print(f"Total records: {n_rec}")
 
 # The FE DC BA frames span multiple HCI records because the BLE MTU fragments them.
 # Instead of trying to reassemble, let's just count ALL FE DC BA sequences in the raw file
@@ -28,21 +40,26 @@ print(f"Total records: {len(records)}")
 # between window acks. It found them as RX records. Let me look at that differently.
 
 # Let me search for ALL FEDC BA80 01 (data frames) in raw file
+# raw.find() does the byte scan in C, so Python only sees the (few) hits.
+# A hit must start before len(raw) - 7, i.e. the 5-byte magic ends by len(raw) - 3.
+DATA_MAGIC = b'\xFE\xDC\xBA\x80\x01'
+scan_end = max(len(raw) - 3, 0)
 data_frame_offsets = []
-for j in range(len(raw) - 7):
-    if raw[j] == 0xFE and raw[j+1] == 0xDC and raw[j+2] == 0xBA and raw[j+3] == 0x80 and raw[j+4] == 0x01:
-        length = (raw[j+5] << 8) | raw[j+6]
-        body_end = j + 7 + length
-        if body_end < len(raw) and raw[body_end] == 0xEF:
-            body = raw[j+7:body_end]
-            data_frame_offsets.append({
-                'offset': j,
-                'length': length,
-                'seq': body[0] if len(body) > 0 else -1,
-                'b1': body[1] if len(body) > 1 else -1,
-                'b2': body[2] if len(body) > 2 else -1,
-                'payload_len': len(body) - 3 if len(body) >= 3 else 0,
-            })
+j = raw.find(DATA_MAGIC, 0, scan_end)
+while j >= 0:
+    length = (raw[j+5] << 8) | raw[j+6]
+    body_end = j + 7 + length
+    if body_end < len(raw) and raw[body_end] == 0xEF:
+        body = raw_view[j+7:body_end]
+        data_frame_offsets.append({
+            'offset': j,
+            'length': length,
+            'seq': body[0] if len(body) > 0 else -1,
+            'b1': body[1] if len(body) > 1 else -1,
+            'b2': body[2] if len(body) > 2 else -1,
+            'payload_len': len(body) - 3 if len(body) >= 3 else 0,
+        })
+    j = raw.find(DATA_MAGIC, j + 1, scan_end)
 
 print(f"Data frames (FEDC BA80 01 with valid EF): {len(data_frame_offsets)}")
 
@@ -73,24 +90,26 @@ if data_frame_offsets:
     print(f"b2 (slot) pattern: {b2s[:20]}...")
     
     # Chunk size distribution
-    sizes = [f['payload_len'] for f in data_frame_offsets]
-    from collections import Counter
-    print(f"Payload size distribution: {dict(Counter(sizes).most_common(5))}")
+    # Counter() tallies in C (_count_elements) and most_common(5) is a heap
+    # selection, so this stays linear in the number of frames
+    size_counts = Counter(f['payload_len'] for f in data_frame_offsets)
+    print(f"Payload size distribution: {dict(size_counts.most_common(5))}")
 else:
     # Data frames might use different flag or the EF terminator is fragmented
     # Let's look for just FE DC BA 80 01 without checking EF
     print("\nSearching for FEDC BA80 01 without EF check...")
     count = 0
-    for j in range(len(raw) - 7):
-        if raw[j] == 0xFE and raw[j+1] == 0xDC and raw[j+2] == 0xBA and raw[j+3] == 0x80 and raw[j+4] == 0x01:
-            length = (raw[j+5] << 8) | raw[j+6]
-            body_start = j + 7
-            if length > 0 and length < 1000:
-                body = raw[body_start:min(body_start+16, len(raw))]
-                hex_body = ' '.join(f'{b:02x}' for b in body)
-                count += 1
-                if count <= 10:
-                    print(f"  @0x{j:06x} claimed_len={length} first_bytes: {hex_body}")
+    j = raw.find(DATA_MAGIC, 0, scan_end)
+    while j >= 0:
+        length = (raw[j+5] << 8) | raw[j+6]
+        body_start = j + 7
+        if length > 0 and length < 1000:
+            body = raw_view[body_start:min(body_start+16, len(raw))]
+            hex_body = ' '.join(f'{b:02x}' for b in body)
+            count += 1
+            if count <= 10:
+                print(f"  @0x{j:06x} claimed_len={length} first_bytes: {hex_body}")
+        j = raw.find(DATA_MAGIC, j + 1, scan_end)
     print(f"Total FEDC BA80 01 sequences: {count}")
 
 # Also look for records between the window ack file offsets
@@ -108,10 +127,15 @@ for i in range(len(wa_record_indices) - 1):
     r1 = wa_record_indices[i]
     r2 = wa_record_indices[i+1]
     num_between = r2 - r1 - 1
-    tx_count = sum(1 for j in range(r1+1, r2) if records[j]['type'] == 0x00)
-    rx_count = sum(1 for j in range(r1+1, r2) if records[j]['type'] == 0x01)
-    total_tx_bytes = sum(len(records[j]['payload']) for j in range(r1+1, r2) if records[j]['type'] == 0x00)
-    total_rx_bytes = sum(len(records[j]['payload']) for j in range(r1+1, r2) if records[j]['type'] == 0x01)
+    # Count and sum over just this window's slice of the record table, never
+    # past the n_rec records this script parses
+    end = min(r2, n_rec)
+    types = rec_type[r1+1:end]
+    lengths = rec_len[r1+1:end]
+    tx_count = types.count(0x00)
+    rx_count = types.count(0x01)
+    total_tx_bytes = sum(compress(lengths, type_mask(types, 0x00)))
+    total_rx_bytes = sum(compress(lengths, type_mask(types, 0x01)))
     print(f"  Between WA[{i}] rec[{r1}] and WA[{i+1}] rec[{r2}]: {num_between} records (TX={tx_count}/{total_tx_bytes}B, RX={rx_count}/{total_rx_bytes}B)")
 
 # Look at the actual TX data in these windows - maybe data is NOT FE-framed
@@ -121,10 +145,9 @@ print("TX PAYLOADS between WA[0] and WA[1]")
 print(f"{'='*70}")
 r1 = wa_record_indices[0]
 r2 = wa_record_indices[1]
-for i in range(r1+1, r2):
-    rec = records[i]
-    if rec['type'] == 0x00:
-        pl = rec['payload']
+for i in range(r1+1, min(r2, n_rec)):
+    if rec_type[i] == 0x00:
+        pl = rec_payload(i)
         hex_data = ' '.join(f'{b:02x}' for b in pl[:min(40, len(pl))])
         if len(pl) > 40:
             hex_data += '...'
@@ -134,13 +157,12 @@ print(f"\n{'='*70}")
 print("DETAILED: Records around window ack 0")
 print(f"{'='*70}")
 wa0 = wa_record_indices[0]
-for i in range(wa0 - 2, min(wa0 + 15, len(records))):
-    rec = records[i]
-    pl = rec['payload']
-    direction = "TX" if rec['type'] == 0x00 else "RX"
+for i in range(wa0 - 2, min(wa0 + 15, n_rec)):
+    pl = rec_payload(i)
+    direction = "TX" if rec_type[i] == 0x00 else "RX"
     hex_data = ' '.join(f'{b:02x}' for b in pl[:min(50, len(pl))])
     if len(pl) > 50:
         hex_data += '...'
     
     marker = " <<<WA0" if i == wa0 else ""
-    print(f"  rec[{i}] type=0x{rec['type']:02x} ({direction}) len={len(pl)} {hex_data}{marker}")
+    print(f"  rec[{i}] type=0x{rec_type[i]:02x} ({direction}) len={len(pl)} {hex_data}{marker}")
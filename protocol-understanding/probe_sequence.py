@@ -1,91 +1,20 @@
 #!/usr/bin/env python3
 """Reconstruct the complete data transfer sequence by parsing ALL BLE records
 for data frames, handling multi-record fragmentation."""
-import struct
+from pklg_cache import load_records
+from pklg_parser import iter_fe_frames
 
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
+CAP_PATH = '/Users/herbst/git/bluetooth-tag/cap.pklg'
 
-off = 0
-records = []
-while off + 13 <= len(raw):
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ts = struct.unpack_from('<Q', raw, off + 4)[0]
-    ptype = raw[off + 12]
-    payload = raw[off + 13:off + 13 + rec_len - 9]
-    records.append({'idx': len(records), 'len': rec_len - 9, 'type': ptype, 'payload': payload, 'ts': ts})
-    off += 4 + rec_len
-    if off > len(raw):
-        break
-
-# Reconstruct L2CAP frames from ACL fragments
-# ACL header: handle(2) + L2CAP length(2)
-# First fragment has flag=0x00 (PB=00), continuation has flag=0x10 (PB=01)
-
-assembled_frames = []
-current_frame = None
-
-for rec in records:
-    if rec['type'] not in (2, 3):
-        continue
-    p = rec['payload']
-    if len(p) < 4:
-        continue
-    
-    acl_hdr = struct.unpack_from('<H', p, 0)[0]
-    handle = acl_hdr & 0x0FFF
-    flags = (acl_hdr >> 12) & 0x0F
-    acl_data_len = struct.unpack_from('<H', p, 2)[0]
-    
-    if flags == 0x00:  # First fragment (PB=00)
-        if len(p) < 8:
-            continue
-        l2cap_len = struct.unpack_from('<H', p, 4)[0]
-        l2cap_cid = struct.unpack_from('<H', p, 6)[0]
-        current_frame = {
-            'direction': 'TX' if rec['type'] == 2 else 'RX',
-            'rec_idx': rec['idx'],
-            'l2cap_len': l2cap_len,
-            'cid': l2cap_cid,
-            'data': bytearray(p[8:]),  # ATT data starts at offset 8
-            'expected': l2cap_len
-        }
-    elif flags == 0x01 and current_frame:  # Continuation (PB=01)
-        current_frame['data'].extend(p[4:])
-    else:
-        continue
-    
-    if current_frame and len(current_frame['data']) >= current_frame['expected']:
-        data = bytes(current_frame['data'][:current_frame['expected']])
-        # Check if this is an ATT write (opcode 0x52=WriteWoR or 0x12=WriteReq)
-        # or ATT notification (0x1B) with FE DC BA frame inside
-        if len(data) >= 3:
-            opcode = data[0]
-            if opcode in (0x52, 0x1B) and len(data) > 2:
-                att_handle = struct.unpack_from('<H', data, 1)[0]
-                att_value = data[3:]
-                
-                # Look for FE DC BA in the ATT value
-                for idx in range(len(att_value)):
-                    if (idx + 7 < len(att_value) and 
-                        att_value[idx] == 0xFE and att_value[idx+1] == 0xDC and att_value[idx+2] == 0xBA):
-                        flag = att_value[idx+3]
-                        cmd = att_value[idx+4]
-                        body_len = (att_value[idx+5] << 8) | att_value[idx+6]
-                        
-                        # Find EF terminator
-                        frame_end = idx + 7 + body_len
-                        if frame_end < len(att_value) and att_value[frame_end] == 0xEF:
-                            body = att_value[idx+7:frame_end]
-                            assembled_frames.append({
-                                'direction': current_frame['direction'],
-                                'rec_idx': current_frame['rec_idx'],
-                                'flag': flag,
-                                'cmd': cmd,
-                                'body': bytes(body),
-                                'body_len': body_len
-                            })
-                        break
-        current_frame = None
+# L2CAP reassembly and the FE DC BA scan are shared with the other scripts
+# (pklg_parser), in one serial pass. Only ATT Write Without Response (0x52)
+# and Handle Value Notification (0x1B) PDUs carry the frames counted here
+raw, rec_off, rec_len, rec_type, _ = load_records(CAP_PATH)
+assembled_frames = [
+    {'direction': 'TX' if ptype == 2 else 'RX', 'flag': flag, 'cmd': cmd, 'body': body}
+    for _, ptype, flag, cmd, body in iter_fe_frames(raw, rec_off, rec_len, rec_type,
+                                                    opcodes=(0x52, 0x1B))
+]
 
 print(f"Assembled {len(assembled_frames)} FE frames")
 
@@ -1,92 +1,109 @@
 #!/usr/bin/env python3
 """Show ALL events (TX and RX) in chronological order between the last tail data chunk and session close."""
 import struct
+import sys
+from array import array
+from bisect import bisect_left
 
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
-off = 0
-records = []
-rec_idx = 0
-while off + 13 <= len(raw):
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ts_secs = struct.unpack_from('<I', raw, off+4)[0]
-    ts_usecs = struct.unpack_from('<I', raw, off+8)[0]
-    ptype = raw[off + 12]
-    payload = raw[off + 13:off + 13 + rec_len - 9]
-    records.append({'idx': rec_idx, 'type': ptype, 'payload': payload, 'ts': ts_secs + ts_usecs/1e6})
-    rec_idx += 1
-    off += 4 + rec_len
-    if off > len(raw):
-        break
+from pklg_cache import acl_indices, open_pklg, walk_records
+
+_FEHDR = struct.Struct('>BBH').unpack_from  # flag, cmd, body length
+_U32BE = struct.Struct('>I').unpack_from
+
+# FE DC BA frame header; find() is bounded to matches starting before
+# len(p) - 7, the same window the old per-byte loops covered
+FE_MAGIC = b'\xFE\xDC\xBA'
+
+raw = open_pklg('/Users/herbst/git/bluetooth-tag/cap.pklg')
+# Record table as columns; the LE64 timestamp is secs (low word) + usecs (high word)
+rec_off, rec_len, rec_type, rec_ts = walk_records(raw)
+
+def rec_time(i):
+    ts = rec_ts[i]
+    return (ts & 0xFFFFFFFF) + (ts >> 32)/1e6
+
+# Events are kept as parallel columns (one entry per event) rather than a
+# dict per event; raw ATT events have flag/cmd -1 and carry att_op/handle
+ev_ts = array('d')
+ev_tx = bytearray()
+ev_flag = array('h')
+ev_cmd = array('h')
+ev_body = []
+ev_rec_idx = array('l')
+ev_att_op = array('h')
+ev_att_handle = array('l')
+
+def add_event(i, flag, cmd, body, att_op=-1, att_handle=-1):
+    ev_ts.append(rec_time(i))
+    ev_tx.append(rec_type[i] == 2)
+    ev_flag.append(flag)
+    ev_cmd.append(cmd)
+    ev_body.append(body)
+    ev_rec_idx.append(i)
+    ev_att_op.append(att_op)
+    ev_att_handle.append(att_handle)
 
 # Parse all FE frames with timestamps
-events = []
-for r in records:
-    if r['type'] not in (2, 3):
-        continue
-    p = r['payload']
-    for idx in range(len(p) - 7):
-        if p[idx] == 0xFE and p[idx+1] == 0xDC and p[idx+2] == 0xBA:
-            flag = p[idx+3]
-            cmd = p[idx+4]
-            blen = (p[idx+5] << 8) | p[idx+6]
-            body = p[idx+7:idx+7+blen]
-            direction = 'TX' if r['type'] == 2 else 'RX'
-            events.append({
-                'dir': direction, 'flag': flag, 'cmd': cmd, 'blen': blen,
-                'body': body, 'ts': r['ts'], 'rec_idx': r['idx']
-            })
-            break
+for i in acl_indices(rec_type):
+    p = raw[rec_off[i] + 13:rec_off[i] + 13 + rec_len[i]]
+    idx = p.find(FE_MAGIC, 0, max(len(p) - 5, 0))
+    if idx >= 0:
+        flag, cmd, blen = _FEHDR(p, idx+3)
+        add_event(i, flag, cmd, p[idx+7:idx+7+blen])
 
 # Also look for non-FE frames (raw BLE notifications/writes)
-for r in records:
-    p = r['payload']
+for i in range(len(rec_type)):
+    p = raw[rec_off[i] + 13:rec_off[i] + 13 + rec_len[i]]
     if len(p) > 11:
         att_op = p[8] if len(p) > 8 else 0
         att_handle = (p[9] | (p[10] << 8)) if len(p) > 10 else 0
         # Check if this record has an FE frame
-        has_fe = any(p[idx] == 0xFE and idx+2 < len(p) and p[idx+1] == 0xDC and p[idx+2] == 0xBA for idx in range(len(p)-7))
+        has_fe = p.find(FE_MAGIC, 0, len(p) - 5) >= 0
         if not has_fe and att_op in (0x1b, 0x52):  # ATT notification or write
-            direction = 'TX' if r['type'] == 2 else 'RX'
-            att_value = p[11:min(len(p), 30)]
-            events.append({
-                'dir': direction, 'flag': -1, 'cmd': -1, 'blen': len(p)-11,
-                'body': att_value, 'ts': r['ts'], 'rec_idx': r['idx'],
-                'att_op': att_op, 'att_handle': att_handle, 'raw': True
-            })
+            add_event(i, -1, -1, p[11:min(len(p), 30)], att_op, att_handle)
 
-events.sort(key=lambda e: e['ts'])
+# Chronological order as an index permutation (stable, like list.sort)
+order = sorted(range(len(ev_ts)), key=ev_ts.__getitem__)
 
 # Find the last 0x1b meta ack timestamp as a reference
 meta_ts = None
-for e in events:
-    if e.get('cmd') == 0x1b and e['dir'] == 'RX':
-        meta_ts = e['ts']
+for k in order:
+    if ev_cmd[k] == 0x1b and not ev_tx[k]:
+        meta_ts = ev_ts[k]
 
 if meta_ts:
     print("=== ALL EVENTS FROM FILE META TO END ===")
     print(f"Reference time: {meta_ts:.6f}")
-    for e in events:
-        if e['ts'] < meta_ts - 0.1:
-            continue
-        t_rel = (e['ts'] - meta_ts) * 1000  # ms relative to meta ack
+    cmd_names = {0x01: 'DATA', 0x1b: 'FILE_META', 0x1d: 'WIN_ACK', 0x20: 'FILE_COMPLETE', 0x1c: 'SESSION_CLOSE'}
+    # Collect the event lines and write them in one go instead of a print
+    # (lock + encode + write) per event
+    out = []
+    # order is sorted by timestamp, so the events to show are a suffix of it;
+    # bisect it by each index's timestamp without building a sorted copy
+    start = bisect_left(order, meta_ts - 0.1, key=ev_ts.__getitem__)
+    for k in order[start:]:
+        t_rel = (ev_ts[k] - meta_ts) * 1000  # ms relative to meta ack
+        direction = 'TX' if ev_tx[k] else 'RX'
+        cmd = ev_cmd[k]
+        body = ev_body[k]
         
-        if e.get('raw'):
-            print(f"  +{t_rel:8.1f}ms  {e['dir']:2s}  RAW att_op=0x{e['att_op']:02x} handle=0x{e['att_handle']:04x} value={e['body'].hex()}")
+        if cmd == -1:
+            out.append(f"  +{t_rel:8.1f}ms  {direction:2s}  RAW att_op=0x{ev_att_op[k]:02x} handle=0x{ev_att_handle[k]:04x} value={body.hex()}")
             continue
             
-        cmd_names = {0x01: 'DATA', 0x1b: 'FILE_META', 0x1d: 'WIN_ACK', 0x20: 'FILE_COMPLETE', 0x1c: 'SESSION_CLOSE'}
-        name = cmd_names.get(e['cmd'], f"cmd_0x{e['cmd']:02x}")
+        name = cmd_names.get(cmd, f"cmd_0x{cmd:02x}")
         
         extra = ''
-        if e['cmd'] == 0x1d and e['dir'] == 'RX' and len(e['body']) >= 8:
-            b = e['body']
-            seq = b[0]
-            ws = (b[2] << 8) | b[3]
-            noff = (b[4] << 24) | (b[5] << 16) | (b[6] << 8) | b[7]
+        if cmd == 0x1d and direction == 'RX' and len(body) >= 8:
+            seq = body[0]
+            ws = (body[2] << 8) | body[3]
+            noff = _U32BE(body, 4)[0]
             extra = f" seq={seq} winSize={ws} nextOff={noff}"
-        elif e['cmd'] == 0x01 and len(e['body']) >= 5:
-            extra = f" seq={e['body'][0]} slot={e['body'][2]}"
-        elif e['cmd'] in (0x20, 0x1c):
-            extra = f" body={e['body'].hex()}"
+        elif cmd == 0x01 and len(body) >= 5:
+            extra = f" seq={body[0]} slot={body[2]}"
+        elif cmd in (0x20, 0x1c):
+            extra = f" body={body.hex()}"
         
-        print(f"  +{t_rel:8.1f}ms  {e['dir']:2s}  flag=0x{e['flag']:02x} {name:16s}{extra}")
+        out.append(f"  +{t_rel:8.1f}ms  {direction:2s}  flag=0x{ev_flag[k]:02x} {name:16s}{extra}")
+    if out:
+        sys.stdout.write('\n'.join(out) + '\n')
@@ -2,68 +2,64 @@
 """Figure out the pklg timestamp format by looking at raw bytes."""
 import struct, datetime
 
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
+from pklg_cache import load_records
 
-# Parse first 20 records
-off = 0
-for i in range(20):
-    if off + 13 > len(raw): break
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ts_bytes = raw[off+4:off+12]
-    ptype = raw[off + 12]
-    
-    # Try various interpretations
-    # 1. Two 32-bit values (LE)
-    lo = struct.unpack_from('<I', raw, off+4)[0]
-    hi = struct.unpack_from('<I', raw, off+8)[0]
-    
-    # 2. Two 32-bit values (BE)
-    hi_be = struct.unpack_from('>I', raw, off+4)[0]
-    lo_be = struct.unpack_from('>I', raw, off+8)[0]
-    
-    # 3. Full 64-bit
-    full_le = struct.unpack_from('<Q', raw, off+4)[0]
-    full_be = struct.unpack_from('>Q', raw, off+4)[0]
-    
-    # Apple's reference date is 2001-01-01
-    apple_epoch = datetime.datetime(2001, 1, 1).timestamp()
-    
-    # Try lo as seconds since apple epoch
-    try:
-        d1 = datetime.datetime.fromtimestamp(lo + apple_epoch)
-    except:
-        d1 = None
-    
-    # Try hi_be as seconds since apple epoch  
-    try:
-        d2 = datetime.datetime.fromtimestamp(hi_be + apple_epoch)
-    except:
-        d2 = None
-    
-    # Try lo as seconds since unix epoch
-    try:
-        d3 = datetime.datetime.fromtimestamp(lo)
-    except:
-        d3 = None
-    
-    # Try hi_be as seconds since unix epoch
-    try:
-        d4 = datetime.datetime.fromtimestamp(hi_be)
-    except:
-        d4 = None
-    
-    # PacketLogger actually uses timestamp in seconds as float64 (double)
-    ts_double = struct.unpack_from('<d', raw, off+4)[0]
-    try:
-        d5 = datetime.datetime.fromtimestamp(ts_double + apple_epoch)
-    except:
-        d5 = None
-    
-    ts_double_be = struct.unpack_from('>d', raw, off+4)[0]
+raw, rec_off, _, _, _ = load_records('/Users/herbst/git/bluetooth-tag/cap.pklg')
+
+# Take the first 20 records, then decode every candidate timestamp layout
+# for all of them at once from one contiguous block of the 8 timestamp bytes
+offsets = rec_off[:20]
+
+n = len(offsets)
+ts_block = b''.join(raw[o+4:o+12] for o in offsets)
+# 1. Two 32-bit values (LE): lo, hi
+pairs_le = struct.unpack(f'<{2*n}I', ts_block)
+# 2. Two 32-bit values (BE): hi_be, lo_be
+pairs_be = struct.unpack(f'>{2*n}I', ts_block)
+# 3. Full 64-bit double (LE / BE)
+doubles_le = struct.unpack(f'<{n}d', ts_block)
+doubles_be = struct.unpack(f'>{n}d', ts_block)
+
+# Apple's reference date is 2001-01-01
+apple_epoch = datetime.datetime(2001, 1, 1).timestamp()
+
+# fromtimestamp() only covers years 1..9999; a cheap range check rejects the
+# many out-of-range candidates (NaN fails it too). The bounds are taken in UTC
+# with two days' margin for any local offset, so computing them can't fail;
+# the platform's localtime() may still refuse an in-range value (e.g. negative
+# timestamps on Windows), which gives None like any other bad candidate
+TS_MIN = datetime.datetime(1, 1, 3, tzinfo=datetime.timezone.utc).timestamp()
+TS_MAX = datetime.datetime(9999, 12, 29, tzinfo=datetime.timezone.utc).timestamp()
+
+def to_date(s):
+    if not TS_MIN < s < TS_MAX:
+        return None
     try:
-        d6 = datetime.datetime.fromtimestamp(ts_double_be + apple_epoch)
-    except:
-        d6 = None
+        return datetime.datetime.fromtimestamp(s)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+def to_dates(secs):
+    return [to_date(s) for s in secs]
+
+lo_all = pairs_le[0::2]
+hi_be_all = pairs_be[0::2]
+# lo / hi_be as seconds since the apple epoch, then since the unix epoch
+d1_all = to_dates([lo + apple_epoch for lo in lo_all])
+d2_all = to_dates([hi_be + apple_epoch for hi_be in hi_be_all])
+d3_all = to_dates(lo_all)
+d4_all = to_dates(hi_be_all)
+# PacketLogger actually uses timestamp in seconds as float64 (double)
+d5_all = to_dates([d + apple_epoch for d in doubles_le])
+d6_all = to_dates([d + apple_epoch for d in doubles_be])
+
+for i, off in enumerate(offsets):
+    ts_bytes = ts_block[8*i:8*i+8]
+    ptype = raw[off + 12]
+    lo, hi = pairs_le[2*i], pairs_le[2*i+1]
+    hi_be, lo_be = pairs_be[2*i], pairs_be[2*i+1]
+    d1, d2, d3 = d1_all[i], d2_all[i], d3_all[i]
+    d4, d5, d6 = d4_all[i], d5_all[i], d6_all[i]
     
     print(f"rec {i}: type={ptype} bytes={ts_bytes.hex()}")
     print(f"  lo_le={lo} hi_le={hi}  |  hi_be={hi_be} lo_be={lo_be}")
@@ -74,5 +70,3 @@ for i in range(20):
     if d5: print(f"  double_le as apple:  {d5}")
     if d6: print(f"  double_be as apple:  {d6}")
     print()
-    
-    off += 4 + rec_len
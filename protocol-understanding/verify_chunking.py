@@ -4,19 +4,17 @@ The capture has 32 data frames, each with a CRC over their payload.
 We know the image, so let's figure out which bytes each chunk contains."""
 import struct
 
+from crc import crc16_xmodem
+
 img = open('/Users/herbst/git/bluetooth-tag/web/public/captured_image.jpg', 'rb').read()
 print(f"Image size: {len(img)} bytes")
 
-def crc16_xmodem(data):
-    crc = 0x0000
-    for b in data:
-        crc ^= b << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = ((crc << 1) ^ 0x1021) & 0xffff
-            else:
-                crc = (crc << 1) & 0xffff
-    return crc
+def find_all(buf, sub):
+    """Yield every offset of sub in buf (overlapping), one C-level find() per hit."""
+    pos = buf.find(sub)
+    while pos >= 0:
+        yield pos
+        pos = buf.find(sub, pos + 1)
 
 # CRCs from capture, along with first_data bytes and payload sizes
 capture_data = [
@@ -84,11 +82,13 @@ print(f"Tail chunks at 490: {len(tail) / 490} (need to check last chunk)")
 # Check tail chunking
 print("\n=== Tail chunking (img[490:]) at 490-byte intervals ===")
 all_match = True
-for i in range(31):
+# CRC all 31 tail chunks in one go over zero-copy views of tail
+tail_view = memoryview(tail)
+tail_crcs = [crc16_xmodem(tail_view[o:o + 490]) for o in range(0, 31 * 490, 490)]
+for i, crc in enumerate(tail_crcs):
     offset = i * 490
     end = min(offset + 490, len(tail))
-    payload = tail[offset:end]
-    crc = crc16_xmodem(payload)
+    payload = tail_view[offset:end]
     cap = capture_data[i][0]
     match = "✓" if crc == cap else "✗"
     if crc != cap:
@@ -121,14 +121,12 @@ print(f"  Capture first 4: {capture_data[30][1]}")
 
 # AHA! Let's check if "af142467" appears in the tail
 target = bytes.fromhex("af142467")
-for pos in range(len(img)):
-    if img[pos:pos+4] == target:
-        print(f"\n  Found 'af142467' at img offset {pos}")
-        print(f"  Relative to tail start (490): {pos - 490}")
+for pos in find_all(img, target):
+    print(f"\n  Found 'af142467' at img offset {pos}")
+    print(f"  Relative to tail start (490): {pos - 490}")
         
-for pos in range(len(tail)):
-    if tail[pos:pos+4] == target:
-        print(f"  Found 'af142467' at tail offset {pos}")
-        expected_chunk = pos // 490
-        expected_offset_in_chunk = pos % 490
-        print(f"  Expected in chunk {expected_chunk}, offset {expected_offset_in_chunk}")
+for pos in find_all(tail, target):
+    print(f"  Found 'af142467' at tail offset {pos}")
+    expected_chunk = pos // 490
+    expected_offset_in_chunk = pos % 490
+    print(f"  Expected in chunk {expected_chunk}, offset {expected_offset_in_chunk}")
@@ -2,22 +2,12 @@
 """Verify our CRC-16 XMODEM implementation against capture data."""
 import struct
 
+from crc import crc16_xmodem
+
 # Load the captured image
 img = open('/Users/herbst/git/bluetooth-tag/web/public/captured_image.jpg', 'rb').read()
 print(f"Image size: {len(img)} bytes")
 
-# CRC-16 XMODEM
-def crc16_xmodem(data):
-    crc = 0x0000
-    for b in data:
-        crc ^= b << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = ((crc << 1) ^ 0x1021) & 0xffff
-            else:
-                crc = (crc << 1) & 0xffff
-    return crc
-
 # Rotation: tail = img[490:], head = img[0:490]
 tail = img[490:]
 head = img[:490]
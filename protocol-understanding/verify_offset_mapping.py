@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 """Map the windowed flow: which chunks go in which window, what offsets."""
+from crc import crc16_xmodem
 
 # WIN_ACKs from capture:
 # seq=1 winSize=3920 nextOff=490
@@ -124,18 +125,10 @@ capture_crcs = [
     0x1fce, 0x7a14, 0xedee, 0x7074, 0xc39f, 0x22ea, 0xdb1f, 0xb03e,
 ]
 
-def crc16_xmodem(data):
-    crc = 0x0000
-    for b in data:
-        crc ^= b << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = ((crc << 1) ^ 0x1021) & 0xffff
-            else:
-                crc = (crc << 1) & 0xffff
-    return crc
-
 all_match = True
+# The windows tile the image without overlap, so every byte is CRC'd once;
+# hand crc16_xmodem views into img instead of copying each chunk out
+img_view = memoryview(img)
 for seq, winSize, nextOff in win_acks:
     chunks_in_win = 0
     remaining = winSize
@@ -143,7 +136,7 @@ for seq, winSize, nextOff in win_acks:
     print(f"\nWindow {seq}: nextOff={nextOff}, winSize={winSize}")
     while remaining > 0 and off < len(img):
         chunk_len = min(490, remaining, len(img) - off)
-        payload = img[off:off+chunk_len]
+        payload = img_view[off:off+chunk_len]
         crc = crc16_xmodem(payload)
         cap_crc = capture_crcs[chunk_idx]
         match = "✓" if crc == cap_crc else "✗"
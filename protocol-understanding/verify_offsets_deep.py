@@ -6,92 +6,77 @@ Compare chunk content against original image at both possible interpretations:
 Also check: does the device ALWAYS start at offset=chunk_size?
 """
 import struct
+from itertools import compress
+
+from crc import crc16_xmodem
+from pklg_cache import acl_indices, load_records, type_mask
+
+FE_MAGIC = b'\xFE\xDC\xBA'
+_FEHDR = struct.Struct('>BBH').unpack_from  # flag, cmd, body length
+_U16BE = struct.Struct('>H').unpack_from
+_WIN_ACK = struct.Struct('>BBHI').unpack_from  # seq, status, winSize, nextOffset
+_DATA_HDR = struct.Struct('>BBBH').unpack_from  # seq, subcmd, slot, crc
+_CHUNK_ACK = struct.Struct('>BBH').unpack_from  # status, seq, chunkSize
 
 img = open('/Users/herbst/git/bluetooth-tag/web/public/captured_image.jpg', 'rb').read()
+img_view = memoryview(img)  # chunk slices for the CRC check, without copying
 
-def crc16_xmodem(data):
-    crc = 0x0000
-    for b in data:
-        crc ^= b << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = ((crc << 1) ^ 0x1021) & 0xffff
-            else:
-                crc = (crc << 1) & 0xffff
-    return crc
+raw, rec_off, rec_len, rec_type, _ = load_records('/Users/herbst/git/bluetooth-tag/cap.pklg')
 
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
-off = 0
-records = []
-rec_idx = 0
-while off + 13 <= len(raw):
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ts_secs = struct.unpack_from('<I', raw, off+4)[0]
-    ts_usecs = struct.unpack_from('<I', raw, off+8)[0]
-    ptype = raw[off + 12]
-    payload = raw[off + 13:off + 13 + rec_len - 9]
-    records.append({'idx': rec_idx, 'type': ptype, 'payload': payload, 'ts': ts_secs + ts_usecs/1e6})
-    rec_idx += 1
-    off += 4 + rec_len
-    if off > len(raw):
-        break
+# Pull the FE frames out of the ACL records of the cached record table. The
+# magic is searched for in the mapped capture itself, so only matched bodies
+# are copied. Frames are kept column-wise (packet type, flag, cmd, body) so the
+# scans below pick their cmd with one type_mask() instead of testing every frame
+ev_type = bytearray()
+ev_flag = bytearray()
+ev_cmd = bytearray()
+ev_body = []
+for i in acl_indices(rec_type):
+    start = rec_off[i] + 13
+    end = start + max(rec_len[i], 0)
+    # First FE DC BA header starting before the payload's last 7 bytes
+    idx = raw.find(FE_MAGIC, start, max(end - 5, start))
+    if idx >= 0:
+        flag, cmd, blen = _FEHDR(raw, idx + 3)
+        ev_type.append(rec_type[i])
+        ev_flag.append(flag)
+        ev_cmd.append(cmd)
+        ev_body.append(raw[idx+7:min(idx+7+blen, end)])
 
-# Extract all FE frames
-events = []
-for r in records:
-    if r['type'] not in (2, 3):
-        continue
-    p = r['payload']
-    for idx in range(len(p) - 7):
-        if p[idx] == 0xFE and p[idx+1] == 0xDC and p[idx+2] == 0xBA:
-            flag = p[idx+3]
-            cmd = p[idx+4]
-            blen = (p[idx+5] << 8) | p[idx+6]
-            body = p[idx+7:idx+7+blen]
-            direction = 'TX' if r['type'] == 2 else 'RX'
-            events.append({'dir': direction, 'flag': flag, 'cmd': cmd, 'blen': blen, 'body': body, 'ts': r['ts']})
-            break
+def frames_with_cmd(cmd):
+    """Indices of the frames carrying cmd, in capture order."""
+    return compress(range(len(ev_cmd)), type_mask(ev_cmd, cmd))
 
 # Find the 0x1b TX and RX
-for e in events:
-    if e['cmd'] == 0x1b and e['dir'] == 'TX':
-        b = e['body']
+for i in frames_with_cmd(0x1b):
+    b = ev_body[i]
+    if ev_type[i] == 2:
         print(f"TX 0x1b body: {b.hex()}")
         print(f"  seq={b[0]}, flags=0x{b[1]:02x}{b[2]:02x}")
-        fsize = (b[3] << 8) | b[4]
+        fsize = _U16BE(b, 3)[0]
         print(f"  fileSize={fsize} (0x{fsize:04x})")
-    if e['cmd'] == 0x1b and e['dir'] == 'RX':
-        b = e['body']
+    else:
         print(f"RX 0x1b ack body: {b.hex()}")
-        status = b[0]
-        seq = b[1]
-        chunk_size = (b[2] << 8) | b[3]
+        status, seq, chunk_size = _CHUNK_ACK(b)
         print(f"  status={status}, seq={seq}, chunk_size={chunk_size} (0x{chunk_size:04x})")
 
 print()
 
 # Now let's look at each WIN_ACK and verify what offset+chunk maps to what image data
 win_acks = []
-for e in events:
-    if e['cmd'] == 0x1d and e['dir'] == 'RX' and e['flag'] == 0x80:
-        b = e['body']
+for i in frames_with_cmd(0x1d):
+    if ev_type[i] == 3 and ev_flag[i] == 0x80:
+        b = ev_body[i]
         if len(b) >= 8:
-            seq = b[0]
-            status = b[1]
-            ws = (b[2] << 8) | b[3]
-            noff = (b[4] << 24) | (b[5] << 16) | (b[6] << 8) | b[7]
-            win_acks.append((seq, status, ws, noff))
+            win_acks.append(_WIN_ACK(b))
 
 # Get the data chunks with their CRCs and first visible bytes
 data_chunks = []
-for e in events:
-    if e['cmd'] == 0x01 and e['flag'] == 0x80 and e['dir'] == 'TX':
-        b = e['body']
+for i in frames_with_cmd(0x01):
+    if ev_flag[i] == 0x80 and ev_type[i] == 2:
+        b = ev_body[i]
         if len(b) >= 5:
-            seq = b[0]
-            subcmd = b[1]
-            slot = b[2]
-            crc = (b[3] << 8) | b[4]
+            seq, subcmd, slot, crc = _DATA_HDR(b)
             first_data = b[5:9] if len(b) > 8 else b[5:]
             data_chunks.append((seq, subcmd, slot, crc, first_data, len(b)-5))
 
@@ -111,7 +96,7 @@ for wseq, wstatus, wsize, woff in win_acks:
         # Verify CRC against img[woff + window_bytes]
         src_offset = woff + window_bytes
         chunk_len = min(490, wsize - window_bytes, len(img) - src_offset)
-        src_data = img[src_offset:src_offset + chunk_len]
+        src_data = img_view[src_offset:src_offset + chunk_len]
         computed_crc = crc16_xmodem(src_data)
         match = "✓" if computed_crc == crc else "✗"
         if computed_crc != crc:
@@ -38,30 +38,20 @@ print()
 # CRC should be for the data at offset 490 (NOT offset 0!)
 import struct
 
-def crc16xmodem(data):
-    crc = 0x0000
-    for byte in data:
-        crc ^= byte << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
-    return crc
+from crc import crc16_xmodem
 
 chunk0 = data[0:490]
 chunk1 = data[490:980]
-print(f'CRC of chunk 0 (offset 0):   0x{crc16xmodem(chunk0):04x}')
-print(f'CRC of chunk 1 (offset 490): 0x{crc16xmodem(chunk1):04x}')
+print(f'CRC of chunk 0 (offset 0):   0x{crc16_xmodem(chunk0):04x}')
+print(f'CRC of chunk 1 (offset 490): 0x{crc16_xmodem(chunk1):04x}')
 print(f'Capture CRC for first frame: 0xC0B8')
 print()
-if crc16xmodem(chunk1) == 0xC0B8:
+if crc16_xmodem(chunk1) == 0xC0B8:
     print('✓ CONFIRMED: First data frame has CRC of chunk 1 (offset 490)')
     print('  => Original app sends chunk 1 first, chunk 0 last!')
-elif crc16xmodem(chunk0) == 0xC0B8:
+elif crc16_xmodem(chunk0) == 0xC0B8:
     print('✓ First data frame has CRC of chunk 0 (offset 0)')
     print('  => Original app sends in normal order')
 else:
     print('✗ Neither CRC matches — need more investigation')
-    print(f'  Expected 0xC0B8, got chunk0=0x{crc16xmodem(chunk0):04x}, chunk1=0x{crc16xmodem(chunk1):04x}')
+    print(f'  Expected 0xC0B8, got chunk0=0x{crc16_xmodem(chunk0):04x}, chunk1=0x{crc16_xmodem(chunk1):04x}')
@@ -14,59 +14,25 @@
 # Option B: Chunk 1 first, chunk 0 last — broke the device
 
 # Let's check what the file looks like in PURE sequential order
-import struct
+from pklg_parser import load_fe_frames
 
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
-off = 0
-records = []
-while off + 13 <= len(raw):
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ptype = raw[off + 12]
-    payload = raw[off + 13:off + 13 + rec_len - 9]
-    records.append({'idx': len(records), 'type': ptype, 'payload': payload})
-    off += 4 + rec_len
-    if off > len(raw): break
-
-current = None
 data_frames = []  # (seq, slot, file_data)
-for rec in records:
-    if rec['type'] not in (2, 3): continue
-    p = rec['payload']
-    if len(p) < 4: continue
-    acl_hdr = struct.unpack_from('<H', p, 0)[0]
-    flags = (acl_hdr >> 12) & 0x0F
-    if flags == 0x00:
-        if len(p) < 8: continue
-        l2cap_len = struct.unpack_from('<H', p, 4)[0]
-        current = {'dir': rec['type'], 'data': bytearray(p[8:]), 'expected': l2cap_len}
-    elif flags == 0x01 and current:
-        current['data'].extend(p[4:])
-    else: continue
-    if current and len(current['data']) >= current['expected']:
-        data = bytes(current['data'][:current['expected']])
-        if len(data) >= 3 and current['dir'] == 2:
-            att_val = data[3:]
-            for idx in range(len(att_val)):
-                if (idx + 7 < len(att_val) and att_val[idx] == 0xFE and att_val[idx+1] == 0xDC and att_val[idx+2] == 0xBA):
-                    flag = att_val[idx+3]
-                    cmd = att_val[idx+4]
-                    blen = (att_val[idx+5] << 8) | att_val[idx+6]
-                    end = idx + 7 + blen
-                    if end < len(att_val) and att_val[end] == 0xEF:
-                        body = att_val[idx+7:end]
-                        if flag == 0x80 and cmd == 0x01 and len(body) >= 5:
-                            seq = body[0]
-                            slot = body[2]
-                            file_data = bytes(body[5:])
-                            data_frames.append((seq, slot, file_data))
-                    break
-        current = None
+for _, ptype, flag, cmd, body in load_fe_frames('/Users/herbst/git/bluetooth-tag/cap.pklg'):
+    if ptype == 2 and flag == 0x80 and cmd == 0x01 and len(body) >= 5:
+        seq = body[0]
+        slot = body[2]
+        file_data = bytes(body[5:])
+        data_frames.append((seq, slot, file_data))
 
 print(f"Extracted {len(data_frames)} data frames")
 print()
 
+# Pull the payloads out once; the three candidate layouts below are just
+# different orderings of the same parts, each built with a single join
+parts = [d for _, _, d in data_frames]
+
 # Option 1: Pure sequential order (frame 0,1,2,...31)
-seq_data = b''.join(d for _, _, d in data_frames)
+seq_data = b''.join(parts)
 print(f"Option A - Sequential order (frames as sent):")
 print(f"  Size: {len(seq_data)} bytes")
 print(f"  First 8: {seq_data[:8].hex()}")
@@ -77,7 +43,7 @@ else:
     print(f"  ✗ NOT valid JPEG start")
 
 # Option 2: Last frame first (the "alt" reconstruction)
-alt_data = data_frames[-1][2] + b''.join(d for _, _, d in data_frames[:-1])
+alt_data = b''.join([parts[-1], *parts[:-1]])
 print(f"\nOption B - Last frame first (alt reconstruction):")
 print(f"  Size: {len(alt_data)} bytes")
 print(f"  First 8: {alt_data[:8].hex()}")
@@ -89,7 +55,7 @@ else:
 
 # Option 3: First 31 frames only (frame 0x25 is re-send of frame 0)
 # If seq 0x25 is just a duplicate/re-send, the file is frames 0x06-0x24
-only31 = b''.join(d for _, _, d in data_frames[:31])
+only31 = b''.join(parts[:31])
 print(f"\nOption C - First 31 frames only (skip re-sent):")
 print(f"  Size: {len(only31)} bytes")
 print(f"  First 8: {only31[:8].hex()}")
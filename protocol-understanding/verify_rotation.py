@@ -7,19 +7,10 @@
 # 
 # We need to verify this produces the same CRCs as the capture.
 
-import struct
+import sys
 
-def crc16xmodem(data):
-    crc = 0x0000
-    for byte in data:
-        crc ^= byte << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
-    return crc
+from crc import crc16_xmodem_blocks
+from pklg_parser import load_fe_frames
 
 # Load the reconstructed JPEG (the valid one)
 jpeg = open('/Users/herbst/git/bluetooth-tag/captured_image.jpg', 'rb').read()
@@ -32,74 +23,43 @@ print(f"Rotated ends with: {rotated[-8:].hex()}")
 print()
 
 # Now extract CRCs from capture frames
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
-off = 0
-records = []
-while off + 13 <= len(raw):
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ptype = raw[off + 12]
-    payload = raw[off + 13:off + 13 + rec_len - 9]
-    records.append({'type': ptype, 'payload': payload})
-    off += 4 + rec_len
-    if off > len(raw): break
-
-current = None
 capture_frames = []
-for rec in records:
-    if rec['type'] not in (2, 3): continue
-    p = rec['payload']
-    if len(p) < 4: continue
-    acl_hdr = struct.unpack_from('<H', p, 0)[0]
-    flags = (acl_hdr >> 12) & 0x0F
-    if flags == 0x00:
-        if len(p) < 8: continue
-        l2cap_len = struct.unpack_from('<H', p, 4)[0]
-        current = {'dir': rec['type'], 'data': bytearray(p[8:]), 'expected': l2cap_len}
-    elif flags == 0x01 and current:
-        current['data'].extend(p[4:])
-    else: continue
-    if current and len(current['data']) >= current['expected']:
-        data = bytes(current['data'][:current['expected']])
-        if len(data) >= 3 and current['dir'] == 2:
-            att_val = data[3:]
-            for idx in range(len(att_val)):
-                if (idx + 7 < len(att_val) and att_val[idx] == 0xFE and att_val[idx+1] == 0xDC and att_val[idx+2] == 0xBA):
-                    flag = att_val[idx+3]
-                    cmd = att_val[idx+4]
-                    blen = (att_val[idx+5] << 8) | att_val[idx+6]
-                    end = idx + 7 + blen
-                    if end < len(att_val) and att_val[end] == 0xEF:
-                        body = att_val[idx+7:end]
-                        if flag == 0x80 and cmd == 0x01 and len(body) >= 5:
-                            seq = body[0]
-                            slot = body[2]
-                            crc_cap = (body[3] << 8) | body[4]
-                            file_data = bytes(body[5:])
-                            capture_frames.append((seq, slot, crc_cap, file_data))
-                    break
-        current = None
+for _, ptype, flag, cmd, body in load_fe_frames('/Users/herbst/git/bluetooth-tag/cap.pklg'):
+    if ptype == 2 and flag == 0x80 and cmd == 0x01 and len(body) >= 5:
+        seq = body[0]
+        slot = body[2]
+        crc_cap = (body[3] << 8) | body[4]
+        file_data = bytes(body[5:])
+        capture_frames.append((seq, slot, crc_cap, file_data))
 
 print(f"Capture frames: {len(capture_frames)}")
 print()
 
-# Compare: chunk our rotated data and check CRCs match capture
+# Compare: chunk our rotated data and check CRCs match capture.
+# CRC every chunk in one pass, then stop at the first mismatch; the
+# per-chunk table is only printed with --verbose or when something differs.
 CHUNK = 490
-all_match = True
-for i, (seq, slot, crc_cap, cap_data) in enumerate(capture_frames):
-    offset = i * CHUNK
-    our_data = rotated[offset:offset + CHUNK]
-    our_crc = crc16xmodem(our_data)
-    
-    match_crc = our_crc == crc_cap
-    match_data = our_data == cap_data
-    
-    status = "✓" if (match_crc and match_data) else "✗"
-    if not (match_crc and match_data):
-        all_match = False
-    
-    print(f"  {status} chunk {i:2d} (seq=0x{seq:02x} slot={slot}): "
-          f"cap_crc=0x{crc_cap:04x} our_crc=0x{our_crc:04x} "
-          f"data_match={match_data} len={len(cap_data)}/{len(our_data)}")
+VERBOSE = '--verbose' in sys.argv[1:]
+our_crcs = crc16_xmodem_blocks(rotated, CHUNK)
+# Frames past the end of our data compare against an empty chunk (CRC 0)
+our_crcs += [0x0000] * (len(capture_frames) - len(our_crcs))
+all_match = all(our_crcs[i] == crc_cap and rotated[i * CHUNK:(i + 1) * CHUNK] == cap_data
+                for i, (_, _, crc_cap, cap_data) in enumerate(capture_frames))
+
+if VERBOSE or not all_match:
+    for i, (seq, slot, crc_cap, cap_data) in enumerate(capture_frames):
+        offset = i * CHUNK
+        our_data = rotated[offset:offset + CHUNK]
+        our_crc = our_crcs[i]
+        
+        match_crc = our_crc == crc_cap
+        match_data = our_data == cap_data
+        
+        status = "✓" if (match_crc and match_data) else "✗"
+        
+        print(f"  {status} chunk {i:2d} (seq=0x{seq:02x} slot={slot}): "
+              f"cap_crc=0x{crc_cap:04x} our_crc=0x{our_crc:04x} "
+              f"data_match={match_data} len={len(cap_data)}/{len(our_data)}")
 
 print()
 if all_match:
@@ -1,71 +1,22 @@
 #!/usr/bin/env python3
 """Find the exact rotation point that matches the capture."""
 
-import struct
-
-def crc16xmodem(data):
-    crc = 0x0000
-    for byte in data:
-        crc ^= byte << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
-    return crc
+from crc import crc16_xmodem_blocks
+from pklg_parser import load_fe_frames
 
 jpeg = open('/Users/herbst/git/bluetooth-tag/captured_image.jpg', 'rb').read()
 CHUNK = 490
 total = len(jpeg)  # 15647
 
-# Parse capture frames 
-raw = open('/Users/herbst/git/bluetooth-tag/cap.pklg', 'rb').read()
-off = 0
-records = []
-while off + 13 <= len(raw):
-    rec_len = struct.unpack_from('<I', raw, off)[0]
-    ptype = raw[off + 12]
-    payload = raw[off + 13:off + 13 + rec_len - 9]
-    records.append({'type': ptype, 'payload': payload})
-    off += 4 + rec_len
-    if off > len(raw): break
-
-current = None
+# Parse capture frames (TX data frames only)
 capture_frames = []
-for rec in records:
-    if rec['type'] not in (2, 3): continue
-    p = rec['payload']
-    if len(p) < 4: continue
-    acl_hdr = struct.unpack_from('<H', p, 0)[0]
-    flags = (acl_hdr >> 12) & 0x0F
-    if flags == 0x00:
-        if len(p) < 8: continue
-        l2cap_len = struct.unpack_from('<H', p, 4)[0]
-        current = {'dir': rec['type'], 'data': bytearray(p[8:]), 'expected': l2cap_len}
-    elif flags == 0x01 and current:
-        current['data'].extend(p[4:])
-    else: continue
-    if current and len(current['data']) >= current['expected']:
-        data = bytes(current['data'][:current['expected']])
-        if len(data) >= 3 and current['dir'] == 2:
-            att_val = data[3:]
-            for idx in range(len(att_val)):
-                if (idx + 7 < len(att_val) and att_val[idx] == 0xFE and att_val[idx+1] == 0xDC and att_val[idx+2] == 0xBA):
-                    flag = att_val[idx+3]
-                    cmd = att_val[idx+4]
-                    blen = (att_val[idx+5] << 8) | att_val[idx+6]
-                    end = idx + 7 + blen
-                    if end < len(att_val) and att_val[end] == 0xEF:
-                        body = att_val[idx+7:end]
-                        if flag == 0x80 and cmd == 0x01 and len(body) >= 5:
-                            seq = body[0]
-                            slot = body[2]
-                            crc_cap = (body[3] << 8) | body[4]
-                            file_data = bytes(body[5:])
-                            capture_frames.append((seq, slot, crc_cap, file_data))
-                    break
-        current = None
+for _, ptype, flag, cmd, body in load_fe_frames('/Users/herbst/git/bluetooth-tag/cap.pklg'):
+    if ptype == 2 and flag == 0x80 and cmd == 0x01 and len(body) >= 5:
+        seq = body[0]
+        slot = body[2]
+        crc_cap = (body[3] << 8) | body[4]
+        file_data = bytes(body[5:])
+        capture_frames.append((seq, slot, crc_cap, file_data))
 
 # The transmitted data as a flat stream (in capture frame order)
 transmitted = b''.join(fd for _, _, _, fd in capture_frames)
@@ -151,12 +102,8 @@ print(f"Match: {capture_frames[31][3] == jpeg[0:490]}")
 # And IMPORTANTLY: the CRC and data for each frame match the original chunk
 
 print("\n--- Verify chunk reordering approach ---")
-chunks = []
-off = 0
-while off < total:
-    end = min(off + CHUNK, total)
-    chunks.append(jpeg[off:end])
-    off = end
+chunks = [jpeg[off:off + CHUNK] for off in range(0, total, CHUNK)]
+our_crcs = crc16_xmodem_blocks(jpeg, CHUNK)  # our_crcs[i] is the CRC of chunks[i]
 
 print(f"Total chunks: {len(chunks)}")
 print(f"Chunk 0: {len(chunks[0])} bytes, starts with {chunks[0][:4].hex()}")
@@ -170,13 +117,12 @@ all_match = True
 for frame_idx, chunk_idx in enumerate(send_order):
     chunk = chunks[chunk_idx]
     cap_seq, cap_slot, cap_crc, cap_data = capture_frames[frame_idx]
-    our_crc = crc16xmodem(chunk)
+    our_crc = our_crcs[chunk_idx]
     
     match_crc = our_crc == cap_crc
     match_data = chunk == cap_data
-    match_len = len(chunk) == len(cap_data)
     
-    if not (match_crc and match_data and match_len):
+    if not (match_crc and match_data):
         all_match = False
         print(f"  ✗ frame {frame_idx:2d}: chunk[{chunk_idx:2d}] len={len(chunk)}/{len(cap_data)} "
               f"crc=0x{our_crc:04x}/0x{cap_crc:04x} data_match={match_data}")